@@ -2,96 +2,761 @@
 """Download all iCloud Drive files to a destination path (e.g., a USB mount).
 
 Requires `pyicloud` (and its deps). Supports 2FA. Skips files whose size already
-matches in the destination. Partial downloads should be removed before rerunning.
+matches in the destination. Interrupted downloads can be continued with --resume.
 """
 
 import argparse
+import atexit
+import logging
+import logging.handlers
 import os
+import queue
+import shutil
+import socket
 import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import lru_cache, partial
 from pathlib import Path
-from typing import Optional
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
 
 from pyicloud import PyiCloudService
 from pyicloud.exceptions import PyiCloudFailedLoginException
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.util.retry import Retry
 
+try:
+    import blake3
+except ImportError:  # only needed for --verify blake3
+    blake3 = None
 
-def _write_stream(resp, dest_path: Path, mode: str, expected_size: Optional[int], start_size: int, show_progress: bool, label: str) -> None:
-    """Write streamed response to disk with optional progress reporting."""
-    bytes_written = start_size
-    report_step = None
-    next_report = None
-    if show_progress and expected_size:
-        report_step = max(expected_size // 20, 1_000_000)  # at most ~20 updates, min 1MB
-        next_report = start_size + report_step
-
-    with open(dest_path, mode) as out:
-        for chunk in resp.iter_content(chunk_size=1024 * 1024):
-            if not chunk:
-                continue
-            out.write(chunk)
-            bytes_written += len(chunk)
-            if report_step and bytes_written >= next_report:
-                pct = (bytes_written / expected_size) * 100
-                print(f"  {label}: {bytes_written}/{expected_size} bytes ({pct:.1f}%)")
-                next_report += report_step
-
-
-def download_node(node, dest_path: Path, resume: bool = False, show_progress: bool = False) -> None:
-    """Recursively download a node from iCloud Drive to dest_path."""
-    if node.type == "FOLDER":
-        dest_path.mkdir(parents=True, exist_ok=True)
-        for child in node:
-            download_node(child, dest_path / child.name, resume=resume, show_progress=show_progress)
+# Per-read chunk for streamed HTTP bodies. Throughput plateaus around ~100 KiB;
+# larger chunks mostly trade memory for fewer Python-level loop iterations.
+DEFAULT_IO_CHUNK_SIZE = 256 * 1024
+# Userspace write buffer; coalesces small writes into fewer write() syscalls.
+DEFAULT_WRITE_BUFFER_SIZE = 1024 * 1024
+# --adaptive-chunks: start small, double while throughput keeps improving.
+ADAPTIVE_MIN_CHUNK = 64 * 1024
+ADAPTIVE_MAX_CHUNK = 4 * 1024 * 1024
+ADAPTIVE_SAMPLE_READS = 16  # reads per throughput sample
+ADAPTIVE_MIN_GAIN = 1.10  # keep doubling only while a sample is >10% faster
+DEFAULT_WORKERS = 8
+VERIFY_CHOICES = ("none", "size", "blake3")
+# Files at least this large are fetched as parallel HTTP Range segments.
+DEFAULT_SEGMENTS = 4
+SEGMENT_THRESHOLD = 64 * 1024 * 1024
+
+_ensured_dirs = set()
+_ensured_dirs_lock = threading.Lock()
+_read_buffers = threading.local()
+_dest_locks: Dict[str, threading.Lock] = {}
+_dest_locks_lock = threading.Lock()
+# Files that failed --verify; reported at the end of the run.
+_failed_downloads: List[Path] = []
+_failed_downloads_lock = threading.Lock()
+
+
+log = logging.getLogger("icloud-downloader")
+
+
+def _start_logging() -> None:
+    """Send log records through a queue drained by one listener thread.
+
+    Worker threads only enqueue, so they never contend on (or wait for) the
+    terminal. Info goes to stdout, warnings and errors to stderr.
+    """
+    if log.handlers:
         return
+    formatter = logging.Formatter("%(message)s")
+    to_stdout = logging.StreamHandler(sys.stdout)
+    to_stdout.addFilter(lambda record: record.levelno < logging.WARNING)
+    to_stderr = logging.StreamHandler(sys.stderr)
+    to_stderr.setLevel(logging.WARNING)
+    for handler in (to_stdout, to_stderr):
+        handler.setFormatter(formatter)
+
+    records = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(records, to_stdout, to_stderr, respect_handler_level=True)
+    log.addHandler(logging.handlers.QueueHandler(records))
+    log.setLevel(logging.INFO)
+    log.propagate = False
+    listener.start()
+    atexit.register(listener.stop)  # flush pending records, including on sys.exit()
+
+
+def _report_progress(label: str, bytes_written: int, expected_size: int) -> None:
+    pct = (bytes_written / expected_size) * 100
+    log.info(f"  {label}: {bytes_written}/{expected_size} bytes ({pct:.1f}%)")
+
+
+def _drop_page_cache(f) -> None:
+    """Tell the kernel a file's pages won't be needed again (no-op where unsupported).
+
+    Downloads are write-once, so keeping them in the page cache only evicts other
+    data. On Linux, DONTNEED also starts writeback of the pages still dirty.
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return
+    f.flush()
+    try:
+        os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+    except OSError:
+        pass
+
+
+def _read_buffer(size: int) -> memoryview:
+    """A `size`-byte view of this thread's scratch buffer, reused across downloads.
+
+    Saves allocating (and zero-filling) a fresh buffer for every file, which
+    dominates for small photos. Callers must be done with the previous view's
+    data before reading into a new one; _write_stream writes each chunk before
+    the next read, so that holds.
+    """
+    buf = getattr(_read_buffers, "buf", None)
+    if buf is None or len(buf) < size:
+        buf = _read_buffers.buf = bytearray(size)
+    return memoryview(buf)[:size]
+
+
+def _adaptive_reader(readinto, label: Optional[str]) -> Callable[[], bytes]:
+    """readinto()-based reader whose buffer grows from ADAPTIVE_MIN_CHUNK.
+
+    Every ADAPTIVE_SAMPLE_READS reads, throughput is measured; the buffer doubles
+    while it improves by more than ADAPTIVE_MIN_GAIN (up to ADAPTIVE_MAX_CHUNK),
+    then stays fixed. The settled size is logged for `label`, if given.
+    """
+    size = ADAPTIVE_MIN_CHUNK
+    view = _read_buffer(size)
+    settled = False
+    reads = 0
+    sample_bytes = 0
+    sample_start = time.monotonic()
+    best_rate = 0.0
+
+    def read():
+        nonlocal size, view, settled, reads, sample_bytes, sample_start, best_rate
+        n = readinto(view)
+        chunk = view[:n]
+        if settled or not n:
+            return chunk
+        reads += 1
+        sample_bytes += n
+        if reads < ADAPTIVE_SAMPLE_READS:
+            return chunk
+        now = time.monotonic()
+        rate = sample_bytes / max(now - sample_start, 1e-6)
+        if rate > best_rate * ADAPTIVE_MIN_GAIN and size < ADAPTIVE_MAX_CHUNK:
+            best_rate = rate
+            size *= 2
+            view = _read_buffer(size)  # `chunk` is written before the next readinto()
+        else:
+            settled = True
+            if label:
+                log.info(f"  {label}: read size settled at {size // 1024} KiB")
+        reads = sample_bytes = 0
+        sample_start = now
+        return chunk
+
+    return read
+
+
+def _is_identity(resp) -> bool:
+    """True if the response body is sent as-is (no Content-Encoding to decode)."""
+    return resp.headers.get("Content-Encoding", "identity").strip().lower() in ("", "identity")
+
+
+def _chunk_reader(
+    resp, io_chunk_size: int, adaptive: bool = False, label: Optional[str] = None
+) -> Callable[[], bytes]:
+    """Return a read() for a streamed response that yields chunks, empty at EOF.
+
+    Identity-encoded bodies are read straight into the thread's reusable buffer,
+    skipping the per-chunk bytes objects of iter_content(); only compressed bodies go
+    through requests' decoder. Each chunk is only valid until the next read().
+    With `adaptive`, identity bodies use _adaptive_reader() instead of a fixed
+    io_chunk_size buffer.
+    """
+    if _is_identity(resp):
+        if adaptive:
+            return _adaptive_reader(resp.raw.readinto, label)
+        view = _read_buffer(io_chunk_size)
+        readinto = resp.raw.readinto
+
+        def read():
+            return view[: readinto(view)]
+
+        return read
+
+    chunks = resp.iter_content(chunk_size=io_chunk_size)
+    return lambda: next(chunks, b"")
+
 
-    dest_path.parent.mkdir(parents=True, exist_ok=True)
-    existing_size = dest_path.stat().st_size if dest_path.exists() else 0
-    total_size = getattr(node, "size", None)
-    if dest_path.exists() and total_size is not None and existing_size == total_size:
-        print(f"[skip] {dest_path} (size matches)")
+def _write_stream(
+    resp,
+    dest_path: Path,
+    mode: str,
+    expected_size: Optional[int],
+    start_size: int,
+    show_progress: bool,
+    label: str,
+    io_chunk_size: int = DEFAULT_IO_CHUNK_SIZE,
+    write_buffer_size: int = DEFAULT_WRITE_BUFFER_SIZE,
+    offset: int = 0,
+    hasher=None,
+    preallocate: Optional[int] = None,
+    adaptive_chunks: bool = False,
+) -> int:
+    """Write streamed response to disk with optional progress reporting.
+
+    Writing starts at byte `offset` of the file (use mode "r+b" for that). If
+    `hasher` is given, every chunk is also fed to hasher.update() as it is written.
+    With `preallocate`, that many bytes are reserved up front and any unused tail
+    is trimmed afterwards. Returns the number of bytes written.
+    """
+    track_progress = bool(show_progress and expected_size)
+    plain_copy = hasher is None and not track_progress and not adaptive_chunks and _is_identity(resp)
+    read = None if plain_copy else _chunk_reader(resp, io_chunk_size, adaptive_chunks, label if show_progress else None)
+    with open(dest_path, mode, buffering=write_buffer_size) as out:
+        if preallocate:
+            _preallocate(out, preallocate)
+        if offset:
+            out.seek(offset)
+        start = out.tell()
+        if hasher is None:
+            write = out.write
+        else:
+            write_out, update = out.write, hasher.update
+
+            def write(chunk):
+                write_out(chunk)
+                update(chunk)
+
+        if plain_copy:
+            # Nothing to do per chunk. urllib3's readinto() is read() plus a copy,
+            # so copyfileobj's plain read()/write() loop is the cheapest way through.
+            shutil.copyfileobj(resp.raw, out, io_chunk_size)
+        elif not track_progress:
+            while chunk := read():
+                write(chunk)
+        else:
+            report_step = max(expected_size // 20, 1_000_000)  # at most ~20 updates, min 1MB
+            next_report = start_size + report_step
+            bytes_written = start_size
+            while chunk := read():
+                write(chunk)
+                bytes_written += len(chunk)
+                if bytes_written >= next_report:
+                    _report_progress(label, bytes_written, expected_size)
+                    next_report += report_step
+        written = out.tell() - start
+        if preallocate:
+            out.truncate()
+        _drop_page_cache(out)
+        return written
+
+
+def _ensure_dir(path: Path) -> None:
+    """mkdir -p, issued at most once per directory per run."""
+    if path in _ensured_dirs:
         return
+    path.mkdir(parents=True, exist_ok=True)
+    with _ensured_dirs_lock:
+        _ensured_dirs.add(path)
+
+
+@lru_cache(maxsize=1024)
+def _dir_size_index(dir_path: Path) -> Dict[str, int]:
+    """Map file name -> size for every file in dir_path, from one scan per directory.
+
+    Cached for the run, so it reflects what was on disk before this run touched dir_path.
+    """
+    try:
+        with os.scandir(dir_path) as entries:
+            return {
+                entry.name: entry.stat(follow_symlinks=False).st_size
+                for entry in entries
+                if entry.is_file(follow_symlinks=False)
+            }
+    except (FileNotFoundError, NotADirectoryError):
+        return {}
+
+
+def _dest_lock(dest_path: Path) -> Tuple[threading.Lock, bool]:
+    """Return the lock serializing jobs that write dest_path, and whether it was claimed before.
+
+    Keyed case-insensitively: FAT/exFAT and default macOS volumes treat names that
+    differ only in case as one file, and duplicate Photos filenames are common.
+    """
+    key = str(dest_path).casefold()
+    with _dest_locks_lock:
+        lock = _dest_locks.get(key)
+        claimed_before = lock is not None
+        if lock is None:
+            lock = _dest_locks[key] = threading.Lock()
+    return lock, claimed_before
+
+
+def _existing_size(dest_path: Path, fresh: bool) -> Optional[int]:
+    """Size of dest_path on disk, or None if missing.
+
+    Uses the pre-run directory index unless `fresh`, i.e. another job of this run
+    may already have written the path.
+    """
+    if not fresh:
+        return _dir_size_index(dest_path.parent).get(dest_path.name)
+    try:
+        return dest_path.stat().st_size
+    except FileNotFoundError:
+        return None
+
+
+def _blake3_path(dest_path: Path) -> Path:
+    return dest_path.with_name(dest_path.name + ".blake3")
+
+
+def _hash_file(path: Path, io_chunk_size: int = DEFAULT_IO_CHUNK_SIZE):
+    """Return a blake3 hasher fed with the current contents of path."""
+    hasher = blake3.blake3()
+    with open(path, "rb") as f:
+        while chunk := f.read(io_chunk_size):
+            hasher.update(chunk)
+        _drop_page_cache(f)
+    return hasher
+
+
+def _is_complete(
+    dest_path: Path,
+    existing_size: Optional[int],
+    expected_size: Optional[int],
+    verify: str,
+    io_chunk_size: int = DEFAULT_IO_CHUNK_SIZE,
+) -> bool:
+    """Decide whether an existing local file can be skipped.
+
+    Sizes must match. With --verify blake3 the file is also re-hashed and compared
+    with the .blake3 sidecar written when it was downloaded (if there is one).
+    """
+    if existing_size is None or expected_size is None or existing_size != expected_size:
+        return False
+    if verify != "blake3":
+        return True
+    try:
+        recorded = _blake3_path(dest_path).read_text().strip()
+    except FileNotFoundError:
+        return True  # downloaded without --verify blake3; size is all we can check
+    if _hash_file(dest_path, io_chunk_size).hexdigest() == recorded:
+        return True
+    log.warning(f"[corrupt] {dest_path} (BLAKE3 mismatch, downloading again)")
+    return False
+
+
+def _finish_download(
+    dest_path: Path,
+    expected_size: Optional[int],
+    verify: str,
+    hasher=None,
+    io_chunk_size: int = DEFAULT_IO_CHUNK_SIZE,
+) -> None:
+    """Check a freshly written file according to --verify and record its BLAKE3.
+
+    A file with the wrong size is moved aside to NAME.size-mismatch and recorded
+    in _failed_downloads so the rest of the run can carry on.
+    """
+    if verify == "none":
+        return
+    size = dest_path.stat().st_size
+    if expected_size is not None and size != expected_size:
+        bad_path = dest_path.with_name(dest_path.name + ".size-mismatch")
+        os.replace(dest_path, bad_path)
+        _blake3_path(dest_path).unlink(missing_ok=True)
+        log.error(f"{dest_path}: downloaded {size} bytes, expected {expected_size}; moved to {bad_path.name}")
+        with _failed_downloads_lock:
+            _failed_downloads.append(dest_path)
+        return
+    if verify == "blake3":
+        if hasher is None:
+            hasher = _hash_file(dest_path, io_chunk_size)
+        _blake3_path(dest_path).write_text(hasher.hexdigest() + "\n")
+
+
+def _new_hasher(verify: str, dest_path: Path, mode: str, io_chunk_size: int = DEFAULT_IO_CHUNK_SIZE):
+    """Return a hasher to feed while streaming, seeded with the existing prefix when resuming."""
+    if verify != "blake3":
+        return None
+    if mode == "ab":
+        return _hash_file(dest_path, io_chunk_size)
+    return blake3.blake3()
+
+
+def _part_path(dest_path: Path) -> Path:
+    return dest_path.with_name(dest_path.name + ".part")
+
+
+def _preallocate(out, size: int) -> None:
+    """Reserve `size` bytes for an open file (--preallocate).
+
+    Only cheap where the filesystem allocates extents without writing them
+    (ext4, XFS, btrfs, APFS). On FAT/exFAT both fallocate and the truncate
+    fallback zero-fill the range, so the file is effectively written twice.
+    """
+    if hasattr(os, "posix_fallocate"):
+        try:
+            os.posix_fallocate(out.fileno(), 0, size)
+            return
+        except OSError:
+            pass  # e.g. EINVAL/EOPNOTSUPP where glibc can't emulate it
+    out.truncate(size)
+
+
+def _download_segmented(
+    fetch: Callable,
+    dest_path: Path,
+    total_size: int,
+    segments: int,
+    show_progress: bool,
+    label: str,
+    io_chunk_size: int = DEFAULT_IO_CHUNK_SIZE,
+    write_buffer_size: int = DEFAULT_WRITE_BUFFER_SIZE,
+    adaptive_chunks: bool = False,
+    preallocate: bool = False,
+) -> None:
+    """Download total_size bytes as `segments` parallel HTTP Range requests.
+
+    fetch(headers) must return a streaming response. Segments are written into
+    DEST.part at their offsets, which is renamed to dest_path once complete. If the
+    server ignores Range (200 instead of 206), the body is streamed normally instead.
+    """
+    step = -(-total_size // segments)
+    ranges = [(lo, min(lo + step, total_size) - 1) for lo in range(0, total_size, step)]
+    part_path = _part_path(dest_path)
+
+    first = fetch({"Range": f"bytes={ranges[0][0]}-{ranges[0][1]}"})
+    if first.status_code != 206:
+        with first:
+            _write_stream(
+                first, dest_path, "wb", total_size, 0, show_progress, label,
+                io_chunk_size=io_chunk_size, write_buffer_size=write_buffer_size,
+                adaptive_chunks=adaptive_chunks,
+            )
+        return
+
+    def fetch_segment(index: int) -> None:
+        lo, hi = ranges[index]
+        resp = first if index == 0 else fetch({"Range": f"bytes={lo}-{hi}"})
+        with resp:
+            if resp.status_code != 206:
+                raise IOError(f"{label}: server ignored Range request for bytes {lo}-{hi}")
+            written = _write_stream(
+                resp, part_path, "r+b", None, 0, False, label,
+                io_chunk_size=io_chunk_size, write_buffer_size=write_buffer_size, offset=lo,
+                adaptive_chunks=adaptive_chunks,
+            )
+        if written != hi - lo + 1:
+            raise IOError(f"{label}: segment {lo}-{hi} is incomplete ({written} bytes)")
+        if show_progress:
+            log.info(f"  {label}: segment {index + 1}/{len(ranges)} done")
+
+    try:
+        with open(part_path, "wb") as out:
+            if preallocate:
+                _preallocate(out, total_size)
+        run_parallel(fetch_segment, range(len(ranges)), len(ranges))
+    except BaseException:
+        first.close()
+        part_path.unlink(missing_ok=True)
+        raise
+    os.replace(part_path, dest_path)
+
+
+def _fetch_to_file(
+    fetch: Callable,
+    headers: Dict[str, str],
+    dest_path: Path,
+    mode: str,
+    expected_size: Optional[int],
+    existing: Optional[int],
+    show_progress: bool,
+    use_part_file: bool,
+    verify: str = "size",
+    io_chunk_size: int = DEFAULT_IO_CHUNK_SIZE,
+    write_buffer_size: int = DEFAULT_WRITE_BUFFER_SIZE,
+    adaptive_chunks: bool = False,
+) -> None:
+    """Stream fetch(headers) into dest_path, then check it according to `verify`.
+
+    The response headers are looked at before any of the body is read:
+    - a Range request answered with 200 (Range ignored) rewrites the file from
+      scratch instead of appending a second copy to the partial one;
+    - if iCloud did not report a size, Content-Length stands in for it, and a
+      local file that already has that size is skipped without reading the body.
+
+    With use_part_file (--preallocate), a fresh download of known size goes to a
+    preallocated DEST.part (one contiguous allocation instead of one extent per
+    chunk) that is renamed into place when complete, so a partial file never looks
+    finished. Such a .part can't be resumed, so it is removed if the download fails.
+    """
+    start_size = existing or 0
+    with fetch(headers) as resp:
+        if "Range" in headers and resp.status_code != 206:
+            log.info(f"[restart] {dest_path} (server ignored Range, downloading from the start)")
+            mode, start_size = "wb", 0
+        if expected_size is None and resp.status_code == 200 and _is_identity(resp):
+            length = resp.headers.get("Content-Length", "")
+            expected_size = int(length) if length.isdigit() else None
+            if mode == "wb" and _is_complete(dest_path, existing, expected_size, verify, io_chunk_size):
+                log.info(f"[skip] {dest_path} (size matches)")
+                return
+        if "Range" not in headers:  # logged only now, after a possible skip above
+            size_note = f"{expected_size} bytes" if expected_size is not None else "size unknown"
+            log.info(f"[get ] {dest_path} ({size_note})")
+
+        hasher = _new_hasher(verify, dest_path, mode, io_chunk_size)
+        preallocate = expected_size if use_part_file and mode == "wb" and expected_size else None
+        target = _part_path(dest_path) if preallocate else dest_path
+        try:
+            _write_stream(
+                resp, target, mode, expected_size, start_size, show_progress, dest_path.name,
+                io_chunk_size=io_chunk_size, write_buffer_size=write_buffer_size,
+                hasher=hasher, preallocate=preallocate, adaptive_chunks=adaptive_chunks,
+            )
+        except BaseException:
+            if preallocate:
+                target.unlink(missing_ok=True)
+            raise
+    if preallocate:
+        os.replace(target, dest_path)
+    _finish_download(dest_path, expected_size, verify, hasher, io_chunk_size)
 
-    headers = {}
-    mode = "wb"
-    if resume and dest_path.exists() and total_size and existing_size < total_size:
-        headers["Range"] = f"bytes={existing_size}-"
-        mode = "ab"
-        print(f"[resume] {dest_path} ({existing_size}/{total_size} bytes)")
-    else:
-        print(f"[get ] {dest_path} ({total_size} bytes)")
 
-    with node.open(stream=True, headers=headers) as resp:
-        label = dest_path.name
-        _write_stream(resp, dest_path, mode, total_size, existing_size, show_progress, label)
+def resolve_drive_path(
+    drive, path: str, cache: Dict[Tuple[str, ...], object]
+) -> Tuple[object, Tuple[str, ...]]:
+    """Look up a '/'-separated path in iCloud Drive one component at a time.
 
+    Returns the node and the normalized path parts (empty parts dropped), which
+    are what the local destination should be built from. Nodes for every prefix
+    are kept in `cache`, so items sharing a parent folder only descend (and list)
+    that folder once. Raises ValueError for paths that name no item or contain
+    '..', and KeyError if not found.
+    """
+    parts = tuple(part for part in path.split("/") if part)
+    if not parts or ".." in parts:
+        raise ValueError(f"Invalid iCloud Drive path: {path}")
+    node = drive
+    for depth in range(1, len(parts) + 1):
+        prefix = parts[:depth]
+        cached = cache.get(prefix)
+        if cached is None:
+            cached = cache[prefix] = node[parts[depth - 1]]
+        node = cached
+    return node, parts
 
-def download_photo_asset(asset, dest_dir: Path, resume: bool = False, show_progress: bool = False) -> None:
-    """Download a photo/video asset if not already present with matching size."""
-    dest_dir.mkdir(parents=True, exist_ok=True)
-    name = getattr(asset, "filename", None) or f"{asset.id}.bin"
-    dest_path = dest_dir / name
 
+def walk_drive(node, dest_path: Path) -> Iterator[Tuple[object, Path]]:
+    """Yield (file_node, dest_path) for every file under a Drive node, creating folders on the way.
+
+    Iterative rather than recursive, so tree depth is unbounded, and lazy, so
+    folders are still being listed while earlier files download.
+    """
+    stack = [(node, dest_path)]
+    while stack:
+        current, path = stack.pop()
+        if current.type == "FOLDER":
+            _ensure_dir(path)
+            _dir_size_index(path)  # warm once here rather than racing in the workers
+            stack.extend((child, path / child.name) for child in current)
+        else:
+            yield current, path
+
+
+def run_parallel(func: Callable, jobs: Iterable, workers: int) -> None:
+    """Call func on every job using a bounded thread pool; re-raise the first failure.
+
+    Jobs are pulled lazily and at most 2*workers are in flight, so long job lists
+    don't allocate a future per job up front, and Drive folders are still being
+    listed by walk_drive() while earlier files download. (Photos are indexed in
+    full beforehand; see build_photo_index().)
+    After a failure, jobs that haven't started are cancelled.
+    """
+    max_pending = workers * 2
+    pending = set()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        try:
+            for job in jobs:
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                pending.add(pool.submit(func, job))
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+        except BaseException:
+            # On failure or Ctrl-C, don't let the pool's shutdown run queued jobs
+            # first; only the ones already in progress are waited for.
+            for future in pending:
+                future.cancel()
+            raise
+
+
+def _download_file(
+    fetch: Callable,
+    dest_path: Path,
+    expected_size: Optional[int],
+    *,
+    resume: bool = False,
+    show_progress: bool = False,
+    io_chunk_size: int = DEFAULT_IO_CHUNK_SIZE,
+    write_buffer_size: int = DEFAULT_WRITE_BUFFER_SIZE,
+    segments: int = DEFAULT_SEGMENTS,
+    verify: str = "size",
+    adaptive_chunks: bool = False,
+    preallocate: bool = False,
+) -> None:
+    """Download fetch(headers) to dest_path unless a complete copy is already there.
+
+    Shared by Drive files and Photos assets: decides between skipping, resuming,
+    a segmented download and a plain stream, with jobs that target the same path
+    serialized by its lock.
+    """
+    _ensure_dir(dest_path.parent)
+    lock, claimed_before = _dest_lock(dest_path)
+    with lock:
+        existing = _existing_size(dest_path, claimed_before)
+        existing_size = existing or 0
+        if _is_complete(dest_path, existing, expected_size, verify, io_chunk_size):
+            log.info(f"[skip] {dest_path} (size matches)")
+            return
+
+        headers = {}
+        mode = "wb"
+        if resume and existing is not None and expected_size and existing_size < expected_size:
+            headers["Range"] = f"bytes={existing_size}-"
+            mode = "ab"
+            log.info(f"[resume] {dest_path} ({existing_size}/{expected_size} bytes)")
+
+        # Segmented .part files can't be resumed, so --resume keeps the in-place path.
+        if not resume and mode == "wb" and segments > 1 and expected_size and expected_size >= SEGMENT_THRESHOLD:
+            log.info(f"[get ] {dest_path} ({expected_size} bytes)")
+            _download_segmented(
+                fetch, dest_path, expected_size, segments, show_progress, dest_path.name,
+                io_chunk_size=io_chunk_size, write_buffer_size=write_buffer_size,
+                adaptive_chunks=adaptive_chunks, preallocate=preallocate,
+            )
+            _finish_download(dest_path, expected_size, verify, io_chunk_size=io_chunk_size)
+            return
+
+        _fetch_to_file(
+            fetch, headers, dest_path, mode, expected_size, existing, show_progress,
+            use_part_file=preallocate and not resume, verify=verify, io_chunk_size=io_chunk_size,
+            write_buffer_size=write_buffer_size, adaptive_chunks=adaptive_chunks,
+        )
+
+
+def download_node(node, dest_path: Path, **options) -> None:
+    """Download a single iCloud Drive file node to dest_path.
+
+    Folders are expanded beforehand by walk_drive(). Options are those of
+    _download_file().
+    """
+
+    def fetch(request_headers):
+        return node.open(stream=True, headers=request_headers)
+
+    _download_file(fetch, dest_path, getattr(node, "size", None), **options)
+
+
+def download_photo_asset(asset, dest_dir: Path, **options) -> None:
+    """Download a photo/video asset if not already present with matching size.
+
+    Options are those of _download_file().
+    """
+
+    def fetch(request_headers):
+        return asset.download(headers=request_headers)
+
+    _download_file(fetch, dest_dir / asset_filename(asset), asset_size(asset), **options)
+
+
+def asset_filename(asset) -> str:
+    """Name an asset is stored under locally."""
+    return getattr(asset, "filename", None) or f"{asset.id}.bin"
+
+
+def asset_size(asset) -> Optional[int]:
+    """Size of the asset's original version as reported by iCloud, if known."""
     versions = getattr(asset, "versions", {}) or {}
     original = versions.get("original", {})
-    expected_size = original.get("size") or original.get("fileSize")
-    existing_size = dest_path.stat().st_size if dest_path.exists() else 0
+    return original.get("size") or original.get("fileSize")
 
-    if dest_path.exists() and expected_size and existing_size == expected_size:
-        print(f"[skip] {dest_path} (size matches)")
-        return
 
-    headers = {}
-    mode = "wb"
-    if resume and dest_path.exists() and expected_size and existing_size < expected_size:
-        headers["Range"] = f"bytes={existing_size}-"
-        mode = "ab"
-        print(f"[resume] {dest_path} ({existing_size}/{expected_size} bytes)")
-    else:
-        print(f"[get ] {dest_path}")
+class PhotoIndex(NamedTuple):
+    """Column-wise snapshot of a Photos collection, built in one pagination pass."""
+
+    assets: List[object]
+    filenames: List[str]
+    sizes: List[Optional[int]]
+
+
+def _slow_photo_meta(asset) -> Tuple[str, Optional[int]]:
+    return asset_filename(asset), asset_size(asset)
+
 
-    resp = asset.download(headers=headers)
-    label = dest_path.name
-    _write_stream(resp, dest_path, mode, expected_size, existing_size, show_progress, label)
+def _photo_meta_getter(sample) -> Callable[[object], Tuple[str, Optional[int]]]:
+    """Pick a (filename, size) extractor for a collection based on its first asset.
+
+    Assets in a library normally share one schema. When the sample has a filename
+    and versions["original"]["size"], use direct lookups and only fall back to
+    the tolerant asset_filename()/asset_size() for assets that differ.
+    """
+    try:
+        fast = bool(sample.filename and sample.versions["original"]["size"])
+    except (AttributeError, KeyError, TypeError):
+        fast = False
+    if not fast:
+        return _slow_photo_meta
+
+    def fast_meta(asset) -> Tuple[str, Optional[int]]:
+        try:
+            name, size = asset.filename, asset.versions["original"]["size"]
+        except (AttributeError, KeyError, TypeError):
+            return _slow_photo_meta(asset)
+        if name and size:
+            return name, size
+        return _slow_photo_meta(asset)
+
+    return fast_meta
+
+
+def build_photo_index(assets: Iterable) -> PhotoIndex:
+    index = PhotoIndex([], [], [])
+    add_asset, add_filename, add_size = index.assets.append, index.filenames.append, index.sizes.append
+    meta = None
+    for asset in assets:
+        if meta is None:
+            meta = _photo_meta_getter(asset)
+        name, size = meta(asset)
+        add_asset(asset)
+        add_filename(name)
+        add_size(size)
+    return index
+
+
+def pending_photos(index: PhotoIndex, dest_dir: Path) -> List[object]:
+    """Assets whose local copy in dest_dir is missing or has a different size.
+
+    One directory scan plus a dict lookup per asset, done before any download is
+    queued, so a rerun over an already-synced library costs no per-asset work.
+    """
+    on_disk = _dir_size_index(dest_dir)
+    return [
+        asset
+        for asset, name, size in zip(index.assets, index.filenames, index.sizes)
+        if size is None or on_disk.get(name) != size
+    ]
 
 
 def asset_label(asset) -> str:
@@ -107,6 +772,33 @@ def format_album_name(key: str, album) -> str:
     return title
 
 
+class _KeepAliveAdapter(HTTPAdapter):
+    """HTTPAdapter whose pooled sockets have TCP keep-alive enabled."""
+
+    def init_poolmanager(self, *args, **kwargs):
+        kwargs["socket_options"] = HTTPConnection.default_socket_options + [
+            (socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        ]
+        super().init_poolmanager(*args, **kwargs)
+
+
+def tune_session(session, pool_size: int) -> None:
+    """Size the session's connection pool for parallel downloads and retry transient errors.
+
+    The default pool keeps only 10 connections per host, so with more concurrent
+    requests than that, connections (and their TLS handshakes) are thrown away.
+    """
+    retry = Retry(
+        total=5,
+        backoff_factor=1,
+        status_forcelist=[429, 500, 502, 503, 504],
+        raise_on_status=False,  # hand the last response back to pyicloud's error handling
+    )
+    adapter = _KeepAliveAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+
+
 def login(apple_id: str, password: Optional[str], cookie_dir: Path) -> PyiCloudService:
     if not password:
         import getpass
@@ -200,7 +892,83 @@ def main() -> None:
         action="store_true",
         help="Show per-file download progress (periodic byte/percentage updates).",
     )
+    parser.add_argument(
+        "--verify",
+        choices=VERIFY_CHOICES,
+        default="size",
+        help=(
+            "Check downloads: 'size' compares byte counts (default), 'blake3' also stores a "
+            "NAME.blake3 hash and re-checks it on later runs (needs `pip install blake3`), "
+            "'none' skips checks."
+        ),
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help=f"Number of files to download in parallel (default: {DEFAULT_WORKERS}).",
+    )
+    parser.add_argument(
+        "--segments",
+        type=int,
+        default=DEFAULT_SEGMENTS,
+        help=(
+            f"Split files of {SEGMENT_THRESHOLD // (1024 * 1024)} MiB or more into this many parallel "
+            f"HTTP Range requests (default: {DEFAULT_SEGMENTS}; 1 disables). Not used with --resume."
+        ),
+    )
+    parser.add_argument(
+        "--preallocate",
+        action="store_true",
+        help=(
+            "Reserve each file's full size before writing to reduce fragmentation (ext4/XFS/APFS). "
+            "Avoid on FAT/exFAT USB drives, where it writes every file twice. "
+            "Interrupted preallocated downloads restart instead of resuming."
+        ),
+    )
+    parser.add_argument(
+        "--io-chunk-size",
+        type=int,
+        default=None,
+        help=(
+            f"Bytes read from the network per iteration (default: {DEFAULT_IO_CHUNK_SIZE}, or "
+            "ICLOUD_IO_CHUNK_SIZE env var). Larger values use less CPU, smaller use less memory."
+        ),
+    )
+    parser.add_argument(
+        "--adaptive-chunks",
+        action="store_true",
+        help=(
+            "Tune the network read size per file instead of using --io-chunk-size: start at "
+            "64 KiB and double while throughput improves, up to 4 MiB."
+        ),
+    )
+    parser.add_argument(
+        "--write-buffer-size",
+        type=int,
+        default=None,
+        help=f"Bytes buffered before each disk write (default: {DEFAULT_WRITE_BUFFER_SIZE}, or ICLOUD_WRITE_BUFFER_SIZE env var).",
+    )
     args = parser.parse_args()
+    for attr, env_var, default in (
+        ("io_chunk_size", "ICLOUD_IO_CHUNK_SIZE", DEFAULT_IO_CHUNK_SIZE),
+        ("write_buffer_size", "ICLOUD_WRITE_BUFFER_SIZE", DEFAULT_WRITE_BUFFER_SIZE),
+    ):
+        source = f"--{attr.replace('_', '-')}"
+        if getattr(args, attr) is None:
+            raw = os.environ.get(env_var)
+            if raw is not None:
+                source = env_var
+            try:
+                setattr(args, attr, default if raw is None else int(raw))
+            except ValueError:
+                parser.error(f"{env_var} must be an integer, got {raw!r}")
+        if getattr(args, attr) <= 0:
+            parser.error(f"{source} must be positive")
+    if args.verify == "blake3" and blake3 is None:
+        parser.error("--verify blake3 requires the blake3 package (pip install blake3)")
+    if args.workers < 1 or args.segments < 1:
+        parser.error("--workers and --segments must be at least 1")
 
     password = args.password or os.environ.get("ICLOUD_PWD")
     dest_root = Path(args.dest).expanduser() if args.dest else None
@@ -211,14 +979,26 @@ def main() -> None:
     )
 
     if requires_dest and not dest_root:
-        print("Error: --dest is required for download operations.", file=sys.stderr)
-        sys.exit(1)
+        parser.error("--dest is required for download operations")
+    _start_logging()
 
     cookie_dir.mkdir(parents=True, exist_ok=True)
     if dest_root:
         dest_root.mkdir(parents=True, exist_ok=True)
 
     api = login(args.apple_id, password, cookie_dir)
+    # Each worker may hold one connection per Range segment.
+    tune_session(api.session, args.workers * max(args.segments, 2))
+    download_opts = {
+        "resume": args.resume,
+        "show_progress": args.progress,
+        "io_chunk_size": args.io_chunk_size,
+        "write_buffer_size": args.write_buffer_size,
+        "segments": args.segments,
+        "preallocate": args.preallocate,
+        "verify": args.verify,
+        "adaptive_chunks": args.adaptive_chunks,
+    }
 
     has_drive_download = args.item or (
         dest_root
@@ -232,61 +1012,97 @@ def main() -> None:
     )
     if has_drive_download:
         targets = args.item
-        if targets:
-            print("Downloading specified items…")
-            for target in targets:
-                try:
-                    node = api.drive[target]
-                except KeyError:
-                    print(f"Not found in iCloud Drive: {target}", file=sys.stderr)
-                    continue
-                download_node(node, dest_root / target, resume=args.resume, show_progress=args.progress)
-        else:
-            print("Listing iCloud Drive root…")
-            for item in api.drive:
-                download_node(item, dest_root / item.name, resume=args.resume, show_progress=args.progress)
 
+        def drive_files() -> Iterator[Tuple[object, Path]]:
+            # Consumed by run_parallel on this thread while workers download.
+            if targets:
+                resolved = {}
+                for target in targets:
+                    try:
+                        node, parts = resolve_drive_path(api.drive, target, resolved)
+                    except ValueError as exc:
+                        log.error(str(exc))
+                        continue
+                    except KeyError:
+                        log.error(f"Not found in iCloud Drive: {target}")
+                        continue
+                    yield from walk_drive(node, dest_root.joinpath(*parts))
+            else:
+                for item in api.drive:
+                    yield from walk_drive(item, dest_root / item.name)
+
+        log.info("Downloading specified items…" if targets else "Listing iCloud Drive root…")
+        run_parallel(lambda job: download_node(job[0], job[1], **download_opts), drive_files(), args.workers)
+
+    # --photos-list and --photos-all share one pass over the (paginated) library;
+    # likewise the album index and each album's contents are fetched at most once.
+    all_photos = None
+    if args.photos_list or args.photos_all:
+        all_photos = build_photo_index(api.photos.all)
+    albums = None
+    if args.photos_list_album or args.photos_list_albums or args.photos_album:
+        albums = api.photos.albums
+    album_photos: Dict[str, PhotoIndex] = {}
+
+    def get_album(album_name: str) -> Optional[PhotoIndex]:
+        if album_name not in album_photos:
+            try:
+                album = albums[album_name]
+            except KeyError:
+                log.error(f"Album not found: {album_name}")
+                return None
+            album_photos[album_name] = build_photo_index(album)
+        return album_photos[album_name]
+
+    # Listings are the command's output rather than status, so they are printed
+    # directly: a closed pipe (e.g. `| head`) then stops the run as usual.
     if args.photos_list or args.photos_list_album or args.photos_list_albums:
         if args.photos_list:
             print("Listing all iCloud Photos:")
-            for asset in api.photos.all:
+            for asset in all_photos.assets:
                 print(asset_label(asset))
         if args.photos_list_album:
-            albums = api.photos.albums
             for album_name in args.photos_list_album:
-                try:
-                    album = albums[album_name]
-                except KeyError:
-                    print(f"Album not found: {album_name}", file=sys.stderr)
+                album = get_album(album_name)
+                if album is None:
                     continue
                 print(f"Listing album: {album_name}")
-                for asset in album:
+                for asset in album.assets:
                     print(asset_label(asset))
         if args.photos_list_albums:
             print("Listing all iCloud Photos albums:")
-            for key, album in api.photos.albums._albums.items():
+            for key, album in albums._albums.items():
                 print(format_album_name(key, album))
 
+    def download_photos(index: PhotoIndex, dest_dir: Path) -> None:
+        assets = index.assets
+        if args.verify != "blake3":  # blake3 re-hashes present files, so those go through one by one
+            assets = pending_photos(index, dest_dir)
+            skipped = len(index.assets) - len(assets)
+            if skipped:
+                log.info(f"[skip] {skipped} files already in {dest_dir} (size matches)")
+        run_parallel(partial(download_photo_asset, dest_dir=dest_dir, **download_opts), assets, args.workers)
+
     if args.photos_all or args.photos_album:
         photos_root = dest_root / "Photos"
         if args.photos_all:
-            print("Downloading all iCloud Photos (this may take a while)…")
-            for asset in api.photos.all:
-                download_photo_asset(asset, photos_root, resume=args.resume, show_progress=args.progress)
+            log.info("Downloading all iCloud Photos (this may take a while)…")
+            download_photos(all_photos, photos_root)
         if args.photos_album:
-            albums = api.photos.albums
             for album_name in args.photos_album:
-                try:
-                    album = albums[album_name]
-                except KeyError:
-                    print(f"Album not found: {album_name}", file=sys.stderr)
+                album = get_album(album_name)
+                if album is None:
                     continue
                 album_dir = photos_root / album_name
-                print(f"Downloading album: {album_name}")
-                for asset in album:
-                    download_photo_asset(asset, album_dir, resume=args.resume, show_progress=args.progress)
+                log.info(f"Downloading album: {album_name}")
+                download_photos(album, album_dir)
 
-    print("Done.")
+    if _failed_downloads:
+        log.error(f"{len(_failed_downloads)} file(s) failed verification:")
+        for path in _failed_downloads:
+            log.error(f"  {path}")
+        sys.exit(1)
+    log.info("Done.")
 
 
 if __name__ == "__main__":